@@ -1,21 +1,86 @@
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, Response, render_template, jsonify, request, g, send_from_directory
+from flask.json.provider import DefaultJSONProvider
+from flask_caching import Cache
+from werkzeug.security import safe_join
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import sqlite3
+import base64
 import hashlib
+import mimetypes
+import queue
+import threading
+import time
+from concurrent.futures import Future
 from datetime import datetime
 import os
 
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson for faster request and response handling"""
+
+    def _options(self, indent=None):
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self._options(kwargs.get('indent'))).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Build the body straight from orjson's bytes, skipping the str round-trip
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        body = orjson.dumps(obj, default=self.default, option=self._options(indent) | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 
 # Build version for cache busting
 BUILD_VERSION = os.environ.get('BUILD_VERSION', datetime.now().strftime('%Y%m%d%H%M%S'))
 
+# Cache-Control policy for static assets and pages
+STATIC_CACHE_EXTENSIONS = frozenset({
+    '.css', '.js', '.png', '.jpg', '.jpeg', '.webp', '.svg', '.ico', '.woff', '.woff2', '.ttf', '.map'
+})
+STATIC_MAX_AGE = 31536000  # 1 year
+# Text assets that the build pre-compresses to a sibling .br file
+PRECOMPRESSED_EXTENSIONS = frozenset({'.css', '.js', '.svg'})
+HTML_MAX_AGE = 300  # 5 minutes
+
+# Upstream metadata configuration
+METADATA_URL = 'https://d3d4yli4hf5bmh.cloudfront.net/metadatav2.json'
+METADATA_POLL_INTERVAL = 5  # seconds
+METADATA_RETRY_INTERVAL = 10  # seconds, after a failed poll
+# (connect, read) seconds per attempt; connects are retried, so they must fail fast
+METADATA_TIMEOUT = (3.05, 10)
+
+# Persistent session so metadata polls reuse the keep-alive TLS connection
+http_session = requests.Session()
+http_session.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    # Read timeouts are not retried: they would stack up the 10s read timeout and surface as ConnectionError
+    max_retries=Retry(total=2, read=False, backoff_factor=0.2)
+))
+
 # Database configuration
 DATABASE_URL = os.environ.get('DATABASE_URL', 'sqlite:///ratings.db')
+DB_PATH = DATABASE_URL[len('sqlite:///'):] if DATABASE_URL.startswith('sqlite:///') else 'ratings.db'
 USE_POSTGRES = DATABASE_URL.startswith('postgresql://') or DATABASE_URL.startswith('postgres://')
 
 if USE_POSTGRES:
     import psycopg2
+    import psycopg2.extensions
+    import psycopg2.pool
     from psycopg2.extras import RealDictCursor
     from urllib.parse import urlparse
 
@@ -29,84 +94,571 @@ if USE_POSTGRES:
         'password': result.password
     }
 
+    class PreparedConnection(psycopg2.extensions.connection):
+        """psycopg2 connection that remembers whether its statements are prepared"""
+        prepared = False
+
+# Statements are prepared server-side once per PostgreSQL session
+PG_PREPARED_STATEMENTS = []
+
+def _statement(name, template, param_count):
+    """Render a SQL template for the configured database, prepared by name on PostgreSQL"""
+    if USE_POSTGRES:
+        params = [f'${i}' for i in range(1, param_count + 1)]
+        PG_PREPARED_STATEMENTS.append(f'PREPARE {name} AS {template.format(*params)}')
+        return f"EXECUTE {name}({', '.join(['%s'] * param_count)})"
+    return template.format(*['?'] * param_count)
+
+# Thumbs up/down counts and the current user's rating in one pass
+SQL_GET_RATINGS = _statement('get_ratings', '''
+    SELECT COALESCE(SUM(CASE WHEN rating = 1 THEN 1 ELSE 0 END), 0),
+           COALESCE(SUM(CASE WHEN rating = -1 THEN 1 ELSE 0 END), 0),
+           MAX(CASE WHEN user_fingerprint = {} THEN rating END)
+    FROM ratings
+    WHERE song_id = {}
+''', 2)
+
+# Same, also matching the user's SHA-256 fingerprint while such rows exist
+SQL_GET_RATINGS_LEGACY = _statement('get_ratings_legacy', '''
+    SELECT COALESCE(SUM(CASE WHEN rating = 1 THEN 1 ELSE 0 END), 0),
+           COALESCE(SUM(CASE WHEN rating = -1 THEN 1 ELSE 0 END), 0),
+           MAX(CASE WHEN user_fingerprint IN ({}, {}) THEN rating END)
+    FROM ratings
+    WHERE song_id = {}
+''', 3)
+
+# The current user's rating alone, a single covering index probe
+SQL_GET_USER_RATING = _statement('get_user_rating', '''
+    SELECT rating FROM ratings WHERE song_id = {} AND user_fingerprint = {}
+''', 2)
+
+SQL_GET_USER_RATING_LEGACY = _statement('get_user_rating_legacy', '''
+    SELECT rating FROM ratings WHERE song_id = {} AND user_fingerprint IN ({}, {})
+''', 3)
+
+# Checked once at startup; new databases never hold SHA-256 fingerprints
+SQL_HAS_LEGACY_FINGERPRINTS = 'SELECT 1 FROM ratings WHERE length(user_fingerprint) = 64 LIMIT 1'
+
+# Artist and title are stored once per song, not on every rating row
+SQL_INSERT_SONG = _statement('insert_song', '''
+    INSERT INTO songs (song_id, artist, title) VALUES ({}, {}, {})
+    ON CONFLICT (song_id) DO NOTHING
+''', 3)
+
+# Insert new rating or overwrite the user's existing one
+SQL_UPSERT_RATING = _statement('upsert_rating', '''
+    INSERT INTO ratings (song_id, user_fingerprint, rating)
+    VALUES ({}, {}, {})
+    ON CONFLICT (song_id, user_fingerprint)
+    DO UPDATE SET rating = excluded.rating, created_at = CURRENT_TIMESTAMP
+''', 3)
+
+SQL_DELETE_RATING = _statement('delete_rating', 'DELETE FROM ratings WHERE song_id = {} AND user_fingerprint = {}', 2)
+
+# Every song that has ever been rated has a songs row
+SQL_RATED_SONG_IDS = 'SELECT song_id FROM songs'
+
+# Rating writes are funnelled through one writer thread per worker process
+WRITE_BATCH_SIZE = 100
+WRITE_TIMEOUT = 10  # seconds a request waits for its write to commit
+
+# Rating cache configuration (SimpleCache is per worker, use RedisCache to share)
+RATINGS_CACHE_TIMEOUT = 10  # seconds
+RATINGS_VERSION_TIMEOUT = RATINGS_CACHE_TIMEOUT * 6  # must outlive any counts cached under it
+RATED_SONGS_REFRESH = RATINGS_CACHE_TIMEOUT  # seconds before other workers' new songs show up
+cache = Cache(app, config={
+    'CACHE_TYPE': os.environ.get('CACHE_TYPE', 'SimpleCache'),
+    'CACHE_REDIS_URL': os.environ.get('CACHE_REDIS_URL', ''),
+    'CACHE_DEFAULT_TIMEOUT': RATINGS_CACHE_TIMEOUT
+})
+
+# Maximum pooled PostgreSQL connections per worker process
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', '4'))
+
+# SQLite connections are reused per thread, PostgreSQL ones come from a pool
+_local = threading.local()
+_pg_pool = None
+_pg_pool_lock = threading.Lock()
+
+# WAL is persisted in the database file, so it only needs to be set once
+_wal_enabled = False
+
+def _open_sqlite():
+    """Open a SQLite connection tuned for concurrent access"""
+    global _wal_enabled
+    conn = sqlite3.connect(DB_PATH)
+    if not _wal_enabled:
+        conn.execute('PRAGMA journal_mode=WAL')
+        _wal_enabled = True
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA busy_timeout=5000')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.execute('PRAGMA cache_size=-20000')  # 20 MB page cache keeps index pages hot
+    return conn
+
+def _get_pg_pool():
+    """Create the PostgreSQL connection pool on first use (after worker fork)"""
+    global _pg_pool
+    if _pg_pool is None:
+        with _pg_pool_lock:
+            if _pg_pool is None:
+                _pg_pool = psycopg2.pool.ThreadedConnectionPool(
+                    1, DB_POOL_MAX, connection_factory=PreparedConnection, **DB_CONFIG
+                )
+    return _pg_pool
+
+def _prepare_statements(conn):
+    """Prepare the rating statements on a PostgreSQL connection that lacks them"""
+    if USE_POSTGRES and not conn.prepared:
+        c = conn.cursor()
+        for statement in PG_PREPARED_STATEMENTS:
+            c.execute(statement)
+        conn.commit()
+        conn.prepared = True
+
+def _connect():
+    """Open a dedicated connection outside the per-request pool"""
+    if USE_POSTGRES:
+        return psycopg2.connect(connection_factory=PreparedConnection, **DB_CONFIG)
+    else:
+        return _open_sqlite()
+
 # Database connection helper
 def get_db_connection():
-    """Get database connection based on configuration"""
+    """Get the database connection for the current request"""
+    if USE_POSTGRES:
+        if 'db_conn' not in g:
+            conn = _get_pg_pool().getconn()
+            _prepare_statements(conn)
+            g.db_conn = conn
+        return g.db_conn
+    else:
+        conn = getattr(_local, 'conn', None)
+        if conn is None:
+            conn = _local.conn = _open_sqlite()
+        return conn
+
+@app.teardown_appcontext
+def release_db_connection(exception):
+    """Finish the request's transaction and hand pooled connections back"""
     if USE_POSTGRES:
-        return psycopg2.connect(**DB_CONFIG)
+        conn = g.pop('db_conn', None)
     else:
-        return sqlite3.connect('ratings.db')
+        conn = getattr(_local, 'conn', None)
+    if conn is None:
+        return
+
+    broken = False
+    try:
+        if exception is None:
+            conn.commit()
+        else:
+            conn.rollback()
+    except Exception as e:
+        # A dropped connection fails here; it must still go back to the pool
+        broken = True
+        app.logger.error(f"Failed to finish database transaction: {str(e)}")
+        if not USE_POSTGRES:
+            _local.conn = None
+            _discard_connection(conn)
+    finally:
+        if USE_POSTGRES:
+            _get_pg_pool().putconn(conn, close=broken or bool(conn.closed))
+
+def _move_song_columns(c, rating_columns):
+    """Migrate artist/title from every rating row into the songs table"""
+    if 'artist' not in rating_columns:
+        return
+    # WHERE true keeps SQLite from parsing ON CONFLICT as part of the SELECT
+    c.execute('''
+        INSERT INTO songs (song_id, artist, title)
+        SELECT song_id, MAX(artist), MAX(title) FROM ratings WHERE true GROUP BY song_id
+        ON CONFLICT (song_id) DO NOTHING
+    ''')
+    c.execute('ALTER TABLE ratings DROP COLUMN artist')
+    c.execute('ALTER TABLE ratings DROP COLUMN title')
+
+# Whether any rating predates the BLAKE2b fingerprints, set by init_db
+_has_legacy_fingerprints = False
 
 # Database initialization
 def init_db():
-    """Initialize database with ratings table"""
+    """Initialize database with songs and ratings tables"""
+    global _has_legacy_fingerprints
     if USE_POSTGRES:
-        conn = get_db_connection()
+        conn = _connect()
         c = conn.cursor()
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS songs (
+                song_id TEXT PRIMARY KEY,
+                artist TEXT NOT NULL,
+                title TEXT NOT NULL
+            )
+        ''')
         c.execute('''
             CREATE TABLE IF NOT EXISTS ratings (
                 id SERIAL PRIMARY KEY,
                 song_id TEXT NOT NULL,
-                artist TEXT NOT NULL,
-                title TEXT NOT NULL,
-                user_fingerprint TEXT NOT NULL,
+                user_fingerprint TEXT NOT NULL CHECK (length(user_fingerprint) = 32),
                 rating INTEGER NOT NULL,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 UNIQUE(song_id, user_fingerprint)
             )
         ''')
+        c.execute("SELECT column_name FROM information_schema.columns WHERE table_name = 'ratings' AND table_schema = current_schema()")
+        _move_song_columns(c, [row[0] for row in c.fetchall()])
+        # Covering index so rating lookups never touch the table
+        c.execute('''
+            CREATE INDEX IF NOT EXISTS idx_ratings_song_fp_rating
+            ON ratings (song_id, user_fingerprint, rating)
+        ''')
+        c.execute(SQL_HAS_LEGACY_FINGERPRINTS)
+        _has_legacy_fingerprints = c.fetchone() is not None
         conn.commit()
         conn.close()
     else:
-        conn = sqlite3.connect('ratings.db')
+        conn = _connect()
         c = conn.cursor()
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS songs (
+                song_id TEXT PRIMARY KEY,
+                artist TEXT NOT NULL,
+                title TEXT NOT NULL
+            )
+        ''')
         c.execute('''
             CREATE TABLE IF NOT EXISTS ratings (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 song_id TEXT NOT NULL,
-                artist TEXT NOT NULL,
-                title TEXT NOT NULL,
-                user_fingerprint TEXT NOT NULL,
+                user_fingerprint TEXT NOT NULL CHECK (length(user_fingerprint) = 32),
                 rating INTEGER NOT NULL,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 UNIQUE(song_id, user_fingerprint)
             )
         ''')
+        _move_song_columns(c, [row[1] for row in c.execute('PRAGMA table_info(ratings)').fetchall()])
+        # Covering index so rating lookups never touch the table
+        c.execute('''
+            CREATE INDEX IF NOT EXISTS idx_ratings_song_fp_rating
+            ON ratings (song_id, user_fingerprint, rating)
+        ''')
+        c.execute(SQL_HAS_LEGACY_FINGERPRINTS)
+        _has_legacy_fingerprints = c.fetchone() is not None
         conn.commit()
         conn.close()
 
+def _fingerprint_input():
+    """Raw "ip:user_agent" bytes the user fingerprint is derived from"""
+    ip = request.headers.get('X-Forwarded-For', request.remote_addr) or ''
+    user_agent = request.headers.get('User-Agent', '')
+    # WSGI headers are latin-1 decoded, so this recovers the raw bytes without a UTF-8 pass
+    return b'%s:%s' % (ip.encode('latin-1', 'replace'), user_agent.encode('latin-1', 'replace'))
+
 def get_user_fingerprint():
     """Generate a unique fingerprint for the user based on IP and User-Agent"""
-    ip = request.headers.get('X-Forwarded-For', request.remote_addr)
-    user_agent = request.headers.get('User-Agent', '')
-    fingerprint = hashlib.sha256(f"{ip}:{user_agent}".encode()).hexdigest()
+    fingerprint = getattr(g, 'user_fp', None)
+    if fingerprint is None:
+        # 128-bit BLAKE2b keeps the key at 32 hex characters
+        fingerprint = hashlib.blake2b(_fingerprint_input(), digest_size=16).hexdigest()
+        # Memoize for the rest of the request
+        g.user_fp = fingerprint
+    return fingerprint
+
+def get_legacy_fingerprint():
+    """SHA-256 fingerprint used before BLAKE2b, or None when no rating still uses one"""
+    if not _has_legacy_fingerprints:
+        return None
+    fingerprint = getattr(g, 'legacy_fp', None)
+    if fingerprint is None:
+        fingerprint = g.legacy_fp = hashlib.sha256(_fingerprint_input()).hexdigest()
     return fingerprint
 
+# Song ids known to have ratings, so unrated songs never reach the cache or database
+_rated_songs = set()
+_rated_songs_loaded_at = None
+_rated_songs_lock = threading.Lock()
+
+def is_rated_song(song_id):
+    """Check whether a song has ever been rated, reloading the known set periodically"""
+    global _rated_songs, _rated_songs_loaded_at
+    loaded_at = _rated_songs_loaded_at
+    if loaded_at is None or time.monotonic() - loaded_at >= RATED_SONGS_REFRESH:
+        with _rated_songs_lock:
+            # Skip the reload if another thread did it while we waited for the lock
+            if _rated_songs_loaded_at is loaded_at:
+                conn = get_db_connection()
+                try:
+                    c = conn.cursor()
+                    c.execute(SQL_RATED_SONG_IDS)
+                    # Keep ids added by this worker while the query ran
+                    _rated_songs = {row[0] for row in c.fetchall()} | _rated_songs
+                except Exception:
+                    conn.rollback()
+                    raise
+                _rated_songs_loaded_at = time.monotonic()
+    return song_id in _rated_songs
+
+def _user_rating(song_id, user_fp, legacy_fp):
+    """Look up the user's own rating for a song with a covering index probe"""
+    conn = get_db_connection()
+    try:
+        c = conn.cursor()
+        if legacy_fp:
+            c.execute(SQL_GET_USER_RATING_LEGACY, (song_id, user_fp, legacy_fp))
+        else:
+            c.execute(SQL_GET_USER_RATING, (song_id, user_fp))
+        row = c.fetchone()
+    except Exception:
+        conn.rollback()
+        raise
+    return row[0] if row else None
+
+def load_ratings(song_id, user_fp, legacy_fp=None):
+    """Get (thumbs_up, thumbs_down, user_rating) for a song, counts from cache when possible"""
+    if not is_rated_song(song_id):
+        # The user's first vote may have gone through another worker since the set was loaded
+        if _user_rating(song_id, user_fp, legacy_fp) is None:
+            return 0, 0, None
+        _rated_songs.add(song_id)
+
+    # Counts are cached under the song's write version, so a reader that raced a write
+    # can only store its stale result under a version nobody reads any more
+    version = cache.get(f'ratings:{song_id}:version') or 0
+    counts_key = f'ratings:{song_id}:v{version}'
+    counts = cache.get(counts_key)
+    if counts is not None:
+        # Never cached: a voter must see their own vote whichever worker answers
+        return counts[0], counts[1], _user_rating(song_id, user_fp, legacy_fp)
+
+    conn = get_db_connection()
+    try:
+        c = conn.cursor()
+        if legacy_fp:
+            # Ratings stored under the user's SHA-256 fingerprint stay theirs until they vote again
+            c.execute(SQL_GET_RATINGS_LEGACY, (user_fp, legacy_fp, song_id))
+        else:
+            c.execute(SQL_GET_RATINGS, (user_fp, song_id))
+        thumbs_up, thumbs_down, user_rating = c.fetchone()
+    except Exception:
+        conn.rollback()
+        raise
+
+    cache.set(counts_key, (thumbs_up, thumbs_down))
+    return thumbs_up, thumbs_down, user_rating
+
+def invalidate_ratings(song_id):
+    """Move a song to a new cache version once a write to it has committed"""
+    # A fresh token rather than a counter: an expired counter would restart at 1 and revive
+    # counts cached under the old 1, and concurrent writers could both land on the same value
+    cache.set(f'ratings:{song_id}:version', time.time_ns(), timeout=RATINGS_VERSION_TIMEOUT)
+
+# Pending rating writes, each paired with the Future its request waits on
+_write_queue = queue.Queue()
+_rating_writer = None
+_rating_writer_lock = threading.Lock()
+
+def _apply_rating(c, song_id, artist, title, user_fp, rating, legacy_fp=None):
+    """Apply one rating write and return the number of affected rows"""
+    legacy_removed = 0
+    if legacy_fp:
+        # A rating stored under the user's SHA-256 fingerprint is replaced by this write
+        c.execute(SQL_DELETE_RATING, (song_id, legacy_fp))
+        legacy_removed = c.rowcount
+
+    if rating == 0:
+        c.execute(SQL_DELETE_RATING, (song_id, user_fp))
+        return c.rowcount + legacy_removed
+    c.execute(SQL_INSERT_SONG, (song_id, artist, title))
+    c.execute(SQL_UPSERT_RATING, (song_id, user_fp, rating))
+    return c.rowcount
+
+def _discard_connection(conn):
+    """Close a connection that may already be broken"""
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+def run_rating_writer():
+    """Commit queued rating writes in batches, one transaction per batch"""
+    conn = None
+    while True:
+        # Block for the first write, then take whatever else queued up meanwhile
+        batch = [_write_queue.get()]
+        while len(batch) < WRITE_BATCH_SIZE:
+            try:
+                batch.append(_write_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        try:
+            if conn is None:
+                conn = _connect()
+                _prepare_statements(conn)
+            c = conn.cursor()
+            results = [_apply_rating(c, *args) for args, _ in batch]
+            conn.commit()
+        except Exception as e:
+            app.logger.error(f"Rating batch failed, retrying writes one by one: {str(e)}")
+            if conn is not None:
+                _discard_connection(conn)
+                conn = None
+        else:
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+            continue
+
+        # Isolate the failing write so it does not take the rest of the batch down
+        for args, future in batch:
+            try:
+                if conn is None:
+                    conn = _connect()
+                    _prepare_statements(conn)
+                result = _apply_rating(conn.cursor(), *args)
+                conn.commit()
+                future.set_result(result)
+            except Exception as e:
+                if conn is not None:
+                    _discard_connection(conn)
+                    conn = None
+                future.set_exception(e)
+
+def start_rating_writer():
+    """Start the rating writer once per worker process"""
+    global _rating_writer
+    if _rating_writer is None:
+        with _rating_writer_lock:
+            if _rating_writer is None:
+                _rating_writer = threading.Thread(target=run_rating_writer, name='rating-writer', daemon=True)
+                _rating_writer.start()
+
+def write_rating(song_id, artist, title, user_fp, rating, legacy_fp=None):
+    """Queue a rating write and wait for it to be committed"""
+    start_rating_writer()
+    future = Future()
+    _write_queue.put(((song_id, artist, title, user_fp, rating, legacy_fp), future))
+    result = future.result(timeout=WRITE_TIMEOUT)
+    if rating != 0:
+        _rated_songs.add(song_id)
+    return result
+
+def song_id_for(metadata):
+    """Derive a song's rating key the same way the player does (base64 of "artist::title")"""
+    artist = metadata.get('artist') or 'Unknown Artist'
+    title = metadata.get('title') or 'Unknown Title'
+    return base64.b64encode(f"{artist}::{title}".encode()).decode()
+
+# Last upstream metadata response, kept fresh by the background poller
+_metadata_cache = {}
+_metadata_lock = threading.Lock()
+_metadata_poller = None
+
+def refresh_metadata():
+    """Fetch station metadata upstream, revalidating the cached copy"""
+    with _metadata_lock:
+        headers = {}
+        if _metadata_cache.get('etag'):
+            headers['If-None-Match'] = _metadata_cache['etag']
+        if _metadata_cache.get('last_modified'):
+            headers['If-Modified-Since'] = _metadata_cache['last_modified']
+
+        response = http_session.get(METADATA_URL, headers=headers, timeout=METADATA_TIMEOUT)
+        if response.status_code == 304 and 'current' in _metadata_cache:
+            return
+
+        response.raise_for_status()
+        # Parsed once per upstream change; the raw bytes are what clients receive
+        metadata = orjson.loads(response.content)
+        _metadata_cache.update(
+            current=(response.content, song_id_for(metadata)),
+            etag=response.headers.get('ETag'),
+            last_modified=response.headers.get('Last-Modified')
+        )
+
+def current_metadata():
+    """Get (raw metadata bytes, song_id) for the track now playing"""
+    start_metadata_poller()
+    if 'current' not in _metadata_cache:
+        # Nothing polled yet in this worker, fetch inline
+        refresh_metadata()
+    return _metadata_cache['current']
+
+def poll_metadata():
+    """Refresh metadata forever so requests never wait on upstream"""
+    while True:
+        try:
+            time.sleep(METADATA_POLL_INTERVAL)
+            refresh_metadata()
+        except Exception as e:
+            app.logger.error(f"Metadata poll error: {str(e)}")
+            time.sleep(METADATA_RETRY_INTERVAL)
+
+def start_metadata_poller():
+    """Start the metadata poller once per worker process"""
+    global _metadata_poller
+    if _metadata_poller is None:
+        with _metadata_lock:
+            if _metadata_poller is None:
+                _metadata_poller = threading.Thread(target=poll_metadata, name='metadata-poller', daemon=True)
+                _metadata_poller.start()
+
 @app.context_processor
 def inject_build_version():
     """Inject build version into templates for cache busting"""
     return {'build_version': BUILD_VERSION}
 
+@app.before_request
+def serve_precompressed_static():
+    """Serve the build's brotli-compressed copy of a static asset when the client accepts br"""
+    if request.endpoint != 'static':
+        return None
+    filename = request.view_args.get('filename', '')
+    if os.path.splitext(filename)[1] not in PRECOMPRESSED_EXTENSIONS:
+        return None
+    compressed = safe_join(app.static_folder, filename + '.br')
+    if compressed is None or not os.path.isfile(compressed):
+        return None
+    # Accept's "in" ignores quality, so an explicit br;q=0 would still match
+    if request.accept_encodings['br'] <= 0:
+        g.static_has_br = True
+        return None
+
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    response = send_from_directory(app.static_folder, filename + '.br', mimetype=mimetype)
+    response.headers['Content-Encoding'] = 'br'
+    response.vary.add('Accept-Encoding')
+    return response
+
 @app.after_request
 def add_cache_headers(response):
     """Add appropriate Cache-Control headers for performance optimization"""
     path = request.path
 
+    # API endpoints - no cache unless the view set its own policy
+    if path.startswith('/api/'):
+        if 'Cache-Control' not in response.headers:
+            response.cache_control.no_cache = True
+            response.cache_control.no_store = True
+            response.cache_control.must_revalidate = True
+
     # Static assets - long cache (1 year)
-    if path.startswith('/static/'):
-        if path.endswith(('.css', '.js', '.png', '.jpg', '.jpeg', '.webp', '.svg', '.woff', '.woff2', '.ttf', '.map')):
-            response.cache_control.max_age = 31536000  # 1 year
+    elif path.startswith('/static/'):
+        # Only versioned URLs are safe to pin: unversioned ones keep send_file's revalidation.
+        # 304s count too: caches copy their headers onto the stored entry
+        if (request.args.get('v') and response.status_code in (200, 304)
+                and os.path.splitext(path)[1] in STATIC_CACHE_EXTENSIONS):
+            # send_file marks responses no-cache, which would force a revalidation every time
+            response.cache_control.no_cache = None
+            response.cache_control.max_age = STATIC_MAX_AGE
             response.cache_control.public = True
-
-    # API endpoints - no cache
-    elif path.startswith('/api/'):
-        response.cache_control.no_cache = True
-        response.cache_control.no_store = True
-        response.cache_control.must_revalidate = True
+            # A new BUILD_VERSION means a new URL, so the content behind this one never changes
+            response.cache_control.immutable = True
+        if g.get('static_has_br'):
+            response.vary.add('Accept-Encoding')
 
     # HTML pages - short cache
     elif path == '/' or path.endswith('.html'):
-        response.cache_control.max_age = 300  # 5 minutes
+        response.cache_control.max_age = HTML_MAX_AGE
         response.cache_control.public = True
 
     return response
@@ -118,9 +670,12 @@ def index():
 @app.route('/api/metadata')
 def get_metadata():
     try:
-        response = requests.get('https://d3d4yli4hf5bmh.cloudfront.net/metadatav2.json', timeout=10)
-        response.raise_for_status()
-        return jsonify(response.json())
+        payload, _ = current_metadata()
+        response = Response(payload, mimetype='application/json')
+        response.cache_control.public = True
+        response.cache_control.max_age = METADATA_POLL_INTERVAL
+        response.add_etag()
+        return response.make_conditional(request)
     except requests.exceptions.Timeout as e:
         app.logger.error(f"Metadata request timeout: {str(e)}")
         return jsonify({'error': 'Metadata service timeout'}), 504
@@ -131,46 +686,63 @@ def get_metadata():
         app.logger.error(f"Unexpected error in metadata endpoint: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/ratings/<song_id>', methods=['GET'])
-def get_ratings(song_id):
-    """Get rating counts for a song"""
-    conn = None
+@app.route('/api/nowplaying')
+def get_now_playing():
+    """Get current track metadata together with its ratings"""
     try:
-        conn = get_db_connection()
-        c = conn.cursor()
-        placeholder = '%s' if USE_POSTGRES else '?'
-
-        # Get thumbs up count
-        c.execute(f'SELECT COUNT(*) FROM ratings WHERE song_id = {placeholder} AND rating = 1', (song_id,))
-        thumbs_up = c.fetchone()[0]
-
-        # Get thumbs down count
-        c.execute(f'SELECT COUNT(*) FROM ratings WHERE song_id = {placeholder} AND rating = -1', (song_id,))
-        thumbs_down = c.fetchone()[0]
+        payload, song_id = current_metadata()
+        thumbs_up, thumbs_down, user_rating = load_ratings(song_id, get_user_fingerprint(), get_legacy_fingerprint())
 
-        # Check if current user has rated this song
-        user_fp = get_user_fingerprint()
-        c.execute(f'SELECT rating FROM ratings WHERE song_id = {placeholder} AND user_fingerprint = {placeholder}', (song_id, user_fp))
-        user_rating_row = c.fetchone()
-        user_rating = user_rating_row[0] if user_rating_row else None
-
-        conn.close()
-
-        return jsonify({
+        # Splice the upstream bytes in rather than decoding and re-encoding them
+        ratings = orjson.dumps({
             'thumbs_up': thumbs_up,
             'thumbs_down': thumbs_down,
             'user_rating': user_rating
         })
+        body = b'{"metadata":%s,"song_id":%s,"ratings":%s}' % (payload, orjson.dumps(song_id), ratings)
+
+        response = Response(body, mimetype='application/json')
+        response.cache_control.no_cache = True
+        response.cache_control.private = True
+        response.add_etag()
+        return response.make_conditional(request)
+    except requests.exceptions.Timeout as e:
+        app.logger.error(f"Metadata request timeout: {str(e)}")
+        return jsonify({'error': 'Metadata service timeout'}), 504
+    except requests.exceptions.RequestException as e:
+        app.logger.error(f"Metadata request error: {str(e)}")
+        return jsonify({'error': 'Unable to fetch metadata'}), 500
+    except Exception as e:
+        app.logger.error(f"Unexpected error in now playing endpoint: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/ratings/<song_id>', methods=['GET'])
+def get_ratings(song_id):
+    """Get rating counts for a song"""
+    try:
+        thumbs_up, thumbs_down, user_rating = load_ratings(song_id, get_user_fingerprint(), get_legacy_fingerprint())
+
+        # Polling clients revalidate and get an empty 304 while nothing changed
+        etag = hashlib.blake2b(f"{thumbs_up}:{thumbs_down}:{user_rating}".encode(), digest_size=8).hexdigest()
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = jsonify({
+                'thumbs_up': thumbs_up,
+                'thumbs_down': thumbs_down,
+                'user_rating': user_rating
+            })
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        response.cache_control.private = True
+        return response
     except Exception as e:
         app.logger.error(f"Error getting ratings for {song_id}: {str(e)}")
-        if conn:
-            conn.close()
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/rate', methods=['POST'])
 def rate_song():
     """Submit, update, or remove a rating for a song"""
-    conn = None
     try:
         data = request.json
         song_id = data.get('song_id')
@@ -182,40 +754,17 @@ def rate_song():
             return jsonify({'error': 'Invalid data'}), 400
 
         user_fp = get_user_fingerprint()
-        placeholder = '%s' if USE_POSTGRES else '?'
-
-        conn = get_db_connection()
-        c = conn.cursor()
-
-        # Check if user has already rated this song
-        c.execute(f'SELECT rating FROM ratings WHERE song_id = {placeholder} AND user_fingerprint = {placeholder}', (song_id, user_fp))
-        existing_rating = c.fetchone()
+        legacy_fp = get_legacy_fingerprint()
 
         if rating == 0:
             # Remove rating
-            if existing_rating:
-                c.execute(f'DELETE FROM ratings WHERE song_id = {placeholder} AND user_fingerprint = {placeholder}', (song_id, user_fp))
-                message = 'Rating removed successfully'
-            else:
-                message = 'No rating to remove'
-        elif existing_rating:
-            # Update existing rating
-            c.execute(f'''
-                UPDATE ratings
-                SET rating = {placeholder}, created_at = CURRENT_TIMESTAMP
-                WHERE song_id = {placeholder} AND user_fingerprint = {placeholder}
-            ''', (rating, song_id, user_fp))
-            message = 'Rating updated successfully'
+            removed = write_rating(song_id, artist, title, user_fp, rating, legacy_fp)
+            message = 'Rating removed successfully' if removed else 'No rating to remove'
         else:
-            # Insert new rating
-            c.execute(f'''
-                INSERT INTO ratings (song_id, artist, title, user_fingerprint, rating)
-                VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder})
-            ''', (song_id, artist, title, user_fp, rating))
-            message = 'Rating submitted successfully'
+            write_rating(song_id, artist, title, user_fp, rating, legacy_fp)
+            message = 'Rating saved successfully'
 
-        conn.commit()
-        conn.close()
+        invalidate_ratings(song_id)
 
         return jsonify({
             'success': True,
@@ -223,9 +772,6 @@ def rate_song():
         })
     except Exception as e:
         app.logger.error(f"Error rating song {song_id if 'song_id' in locals() else 'unknown'}: {str(e)}")
-        if conn:
-            conn.rollback()
-            conn.close()
         return jsonify({'error': str(e)}), 500
 
 # Initialize database on module load
@@ -6,7 +6,11 @@ const status = document.getElementById('status');
 const loading = document.getElementById('loading');
 const error = document.getElementById('error');
 const streamUrl = 'https://d3d4yli4hf5bmh.cloudfront.net/hls/live.m3u8';
-const metadataUrl = '/api/metadata';
+const nowPlayingUrl = '/api/nowplaying';
+// Build version from this script's own ?v= so lazily loaded assets are cache-busted too
+const buildVersion = document.currentScript
+    ? new URL(document.currentScript.src, window.location.href).searchParams.get('v')
+    : null;
 
 let isPlaying = false;
 let hls = null;
@@ -73,7 +77,7 @@ function loadHlsLibrary() {
         status.textContent = 'Loading player...';
 
         const script = document.createElement('script');
-        script.src = '/static/js/hls.min.js';
+        script.src = buildVersion ? `/static/js/hls.min.js?v=${buildVersion}` : '/static/js/hls.min.js';
         script.async = true;
 
         script.onload = () => {
@@ -95,11 +99,9 @@ function loadHlsLibrary() {
 // Metadata fetching and display
 async function fetchMetadata() {
     try {
-        const response = await fetch(metadataUrl, {
-            cache: 'no-store',
-            headers: {
-                'Cache-Control': 'no-cache'
-            }
+        // Metadata and ratings arrive together; revalidate via ETag on each poll
+        const response = await fetch(nowPlayingUrl, {
+            cache: 'no-cache'
         });
 
         if (!response.ok) {
@@ -107,8 +109,9 @@ async function fetchMetadata() {
         }
 
         const data = await response.json();
-        updateNowPlaying(data);
-        updatePlaylistHistory(data);
+        updateNowPlaying(data.metadata);
+        renderRatings(data.ratings);
+        updatePlaylistHistory(data.metadata);
 
         document.getElementById('metadataStatus').textContent =
             'Metadata: Updated ' + new Date().toLocaleTimeString();
@@ -162,9 +165,6 @@ function updateNowPlaying(data) {
     const sampleRate = data.sample_rate ?
         (data.sample_rate / 1000).toFixed(1) + ' kHz' : 'N/A';
     audioQuality.textContent = `Lossless quality: ${bitDepth}-bit / ${sampleRate}`;
-
-    // Fetch ratings for the new track
-    fetchRatings();
 }
 
 function updatePlaylistHistory(data) {
@@ -344,29 +344,35 @@ async function fetchRatings() {
     try {
         const response = await fetch(`/api/ratings/${currentSongId}`);
         const data = await response.json();
+        renderRatings(data);
+    } catch (err) {
+        console.error('Error fetching ratings:', err);
+    }
+}
 
-        document.getElementById('thumbsUpCount').textContent = data.thumbs_up;
-        document.getElementById('thumbsDownCount').textContent = data.thumbs_down;
+function renderRatings(data) {
+    document.getElementById('thumbsUpCount').textContent = data.thumbs_up;
+    document.getElementById('thumbsDownCount').textContent = data.thumbs_down;
 
-        const thumbsUpBtn = document.getElementById('thumbsUpBtn');
-        const thumbsDownBtn = document.getElementById('thumbsDownBtn');
+    const thumbsUpBtn = document.getElementById('thumbsUpBtn');
+    const thumbsDownBtn = document.getElementById('thumbsDownBtn');
 
-        thumbsUpBtn.classList.remove('active');
-        thumbsDownBtn.classList.remove('active');
+    thumbsUpBtn.classList.remove('active');
+    thumbsDownBtn.classList.remove('active');
 
-        if (data.user_rating === 1) {
-            thumbsUpBtn.classList.add('active');
-        } else if (data.user_rating === -1) {
-            thumbsDownBtn.classList.add('active');
-        }
-    } catch (err) {
-        console.error('Error fetching ratings:', err);
+    if (data.user_rating === 1) {
+        thumbsUpBtn.classList.add('active');
+    } else if (data.user_rating === -1) {
+        thumbsDownBtn.classList.add('active');
     }
 }
 
 async function submitRating(rating) {
     if (!currentSongId || !currentArtist || !currentTitle) return;
 
+    const hadRating = document.getElementById('thumbsUpBtn').classList.contains('active') ||
+        document.getElementById('thumbsDownBtn').classList.contains('active');
+
     try {
         const response = await fetch('/api/rate', {
             method: 'POST',
@@ -387,7 +393,7 @@ async function submitRating(rating) {
         if (data.success) {
             if (data.message.includes('removed')) {
                 messageEl.textContent = 'Rating removed!';
-            } else if (data.message.includes('updated')) {
+            } else if (hadRating) {
                 messageEl.textContent = 'Rating changed!';
             } else {
                 messageEl.textContent = 'Thank you for your rating!';
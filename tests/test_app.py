@@ -1,12 +1,23 @@
 import pytest
+import base64
 import json
 import os
+import queue
 import tempfile
+import requests
+import sqlite3
+import threading
 from unittest.mock import patch, MagicMock
 import sys
+from flask import g
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from app import app, init_db, get_user_fingerprint
+# Keep the import-time init_db() away from the repo's ratings.db
+os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
+
+from app import (app, cache, init_db, get_user_fingerprint, get_legacy_fingerprint, get_db_connection, refresh_metadata,
+                 write_rating, invalidate_ratings, _apply_rating, _statement, _metadata_cache)
+import app as app_module
 
 
 @pytest.fixture
@@ -16,16 +27,27 @@ def client():
     db_fd, db_path = tempfile.mkstemp()
     app.config['TESTING'] = True
 
-    # Override database URL to use SQLite for tests
-    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    # Start every test without cached data or a background poller
+    _metadata_cache.clear()
+    cache.clear()
 
-    with app.test_client() as client:
+    # Fresh connections and a fresh writer thread so nothing still points at another test's database
+    local = threading.local()
+    with app.test_client() as client, patch('app.DB_PATH', db_path), patch('app._wal_enabled', False), \
+            patch('app._local', local), patch('app._write_queue', queue.Queue()), \
+            patch('app._rating_writer', None), patch('app._rated_songs', set()), \
+            patch('app.start_metadata_poller'), patch('app._rated_songs_loaded_at', None):
         with app.app_context():
             init_db()
         yield client
+        conn = getattr(local, 'conn', None)
+        if conn is not None:
+            conn.close()
 
     os.close(db_fd)
-    os.unlink(db_path)
+    for path in (db_path, f'{db_path}-wal', f'{db_path}-shm'):
+        if os.path.exists(path):
+            os.unlink(path)
 
 
 class TestRoutes:
@@ -44,15 +66,15 @@ class TestRoutes:
         assert b'style.min.css' in response.data
         assert b'script.min.js' in response.data
 
-    @patch('app.requests.get')
+    @patch('app.http_session.get')
     def test_metadata_endpoint_success(self, mock_get, client):
         """Test successful metadata fetch"""
         mock_response = MagicMock()
-        mock_response.json.return_value = {
+        mock_response.content = json.dumps({
             'artist': 'Test Artist',
             'title': 'Test Song',
             'album': 'Test Album'
-        }
+        }).encode()
         mock_response.raise_for_status = MagicMock()
         mock_get.return_value = mock_response
 
@@ -62,7 +84,84 @@ class TestRoutes:
         assert data['artist'] == 'Test Artist'
         assert data['title'] == 'Test Song'
 
-    @patch('app.requests.get')
+    @patch('app.http_session.get')
+    def test_metadata_endpoint_cached(self, mock_get, client):
+        """Test that requests are served from the polled cache"""
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.headers = {'ETag': '"abc"'}
+        mock_response.content = b'{"artist": "Test Artist"}'
+        mock_get.return_value = mock_response
+
+        client.get('/api/metadata')
+        response = client.get('/api/metadata')
+        assert response.status_code == 200
+        assert mock_get.call_count == 1
+        assert 'max-age=5' in response.headers.get('Cache-Control', '')
+        assert response.headers.get('ETag')
+
+    @patch('app.http_session.get')
+    def test_refresh_metadata_revalidates(self, mock_get, client):
+        """Test that a refresh revalidates the cached copy with If-None-Match"""
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.headers = {'ETag': '"abc"'}
+        mock_response.content = b'{"artist": "Test Artist"}'
+        mock_get.return_value = mock_response
+        refresh_metadata()
+
+        # Upstream answers the revalidation with 304
+        not_modified = MagicMock()
+        not_modified.status_code = 304
+        mock_get.return_value = not_modified
+        refresh_metadata()
+
+        assert mock_get.call_args.kwargs['headers']['If-None-Match'] == '"abc"'
+        # Retried connects to an unreachable upstream must not stack up the read timeout
+        connect_timeout, read_timeout = mock_get.call_args.kwargs['timeout']
+        assert connect_timeout < read_timeout
+        response = client.get('/api/metadata')
+        assert response.status_code == 200
+        assert json.loads(response.data)['artist'] == 'Test Artist'
+
+    @patch('app.http_session.get')
+    def test_now_playing_endpoint(self, mock_get, client):
+        """Test that metadata and ratings come back in one response"""
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.headers = {}
+        mock_response.content = b'{"artist": "Now Artist", "title": "Now Song"}'
+        mock_get.return_value = mock_response
+
+        song_id = base64.b64encode(b'Now Artist::Now Song').decode()
+        rating_data = {
+            'song_id': song_id,
+            'artist': 'Now Artist',
+            'title': 'Now Song',
+            'rating': 1
+        }
+        client.post('/api/rate',
+                    data=json.dumps(rating_data),
+                    content_type='application/json')
+
+        response = client.get('/api/nowplaying')
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert data['metadata']['artist'] == 'Now Artist'
+        assert data['song_id'] == song_id
+        assert data['ratings']['thumbs_up'] == 1
+        assert data['ratings']['user_rating'] == 1
+        assert 'private' in response.headers.get('Cache-Control', '')
+
+    @patch('app.http_session.get')
+    def test_metadata_endpoint_upstream_timeout(self, mock_get, client):
+        """Test that an upstream timeout maps to 504"""
+        mock_get.side_effect = requests.exceptions.ReadTimeout('read timed out')
+
+        response = client.get('/api/metadata')
+        assert response.status_code == 504
+
+    @patch('app.http_session.get')
     def test_metadata_endpoint_timeout(self, mock_get, client):
         """Test metadata endpoint handles timeouts"""
         mock_get.side_effect = Exception('Timeout')
@@ -183,6 +282,194 @@ class TestRatings:
         assert data['thumbs_down'] == 0
         assert data['user_rating'] is None
 
+    def test_remove_missing_rating(self, client):
+        """Test removing a rating that was never submitted"""
+        rating_data = {
+            'song_id': 'test_song_never_rated',
+            'artist': 'Test Artist',
+            'title': 'Test Song',
+            'rating': 0
+        }
+        response = client.post('/api/rate',
+                               data=json.dumps(rating_data),
+                               content_type='application/json')
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert data['success'] is True
+        assert data['message'] == 'No rating to remove'
+
+    def test_unrated_song_skips_counts_query(self, client):
+        """Test that songs nobody has rated only cost the user's own rating probe"""
+        client.get('/api/ratings/test_song_warmup')
+
+        mock_conn = MagicMock()
+        mock_conn.cursor.return_value.fetchone.return_value = None
+        with patch('app.get_db_connection', return_value=mock_conn):
+            response = client.get('/api/ratings/test_song_nobody_rated')
+        execute = mock_conn.cursor.return_value.execute
+        assert execute.call_count == 1
+        assert execute.call_args.args[0] == app_module.SQL_GET_USER_RATING
+        data = json.loads(response.data)
+        assert data['thumbs_up'] == 0
+        assert data['thumbs_down'] == 0
+        assert data['user_rating'] is None
+
+    def test_first_vote_from_another_worker_visible(self, client):
+        """Test that a first vote committed elsewhere after the rated set loaded still shows up"""
+        headers = {'User-Agent': 'other-worker-test'}
+        with app.test_request_context(headers=headers, environ_base={'REMOTE_ADDR': '127.0.0.1'}):
+            user_fp = get_user_fingerprint()
+        client.get('/api/ratings/test_song_warmup', headers=headers)
+
+        # Another worker commits the song's first rating through its own connection
+        conn = sqlite3.connect(app_module.DB_PATH)
+        conn.execute("INSERT INTO songs VALUES ('new_song', 'Test Artist', 'Test Song')")
+        conn.execute("INSERT INTO ratings (song_id, user_fingerprint, rating) VALUES ('new_song', ?, 1)", (user_fp,))
+        conn.commit()
+        conn.close()
+
+        data = json.loads(client.get('/api/ratings/new_song', headers=headers).data)
+        assert data == {'thumbs_up': 1, 'thumbs_down': 0, 'user_rating': 1}
+
+    def test_ratings_served_from_cache(self, client):
+        """Test that counts are cached until a write while the user's own rating is always read"""
+        song_id = 'test_song_cached'
+        headers = {'User-Agent': 'cache-test'}
+        with app.test_request_context(headers=headers, environ_base={'REMOTE_ADDR': '127.0.0.1'}):
+            user_fp = get_user_fingerprint()
+        write_rating(song_id, 'Test Artist', 'Test Song', 'c' * 32, 1)
+        client.get(f'/api/ratings/{song_id}', headers=headers)
+
+        # Writes committed by another worker leave this worker's counts cached...
+        write_rating(song_id, 'Test Artist', 'Test Song', 'd' * 32, 1)
+        write_rating(song_id, 'Test Artist', 'Test Song', user_fp, -1)
+        data = json.loads(client.get(f'/api/ratings/{song_id}', headers=headers).data)
+        assert data['thumbs_up'] == 1
+        assert data['thumbs_down'] == 0
+        # ...but the voter sees their own rating straight away
+        assert data['user_rating'] == -1
+
+        # A write through this worker moves the song to fresh counts
+        rating_data = {
+            'song_id': song_id,
+            'artist': 'Test Artist',
+            'title': 'Test Song',
+            'rating': 1
+        }
+        client.post('/api/rate',
+                    data=json.dumps(rating_data),
+                    content_type='application/json',
+                    headers=headers)
+        data = json.loads(client.get(f'/api/ratings/{song_id}', headers=headers).data)
+        assert data['thumbs_up'] == 3
+        assert data['thumbs_down'] == 0
+        assert data['user_rating'] == 1
+
+    def test_stale_counts_after_write_ignored(self, client):
+        """Test that counts stored by a reader that raced a write are never served"""
+        song_id = 'test_song_race'
+        write_rating(song_id, 'Test Artist', 'Test Song', 'c' * 32, 1)
+        client.get(f'/api/ratings/{song_id}')
+
+        write_rating(song_id, 'Test Artist', 'Test Song', 'd' * 32, 1)
+        invalidate_ratings(song_id)
+        # The racing reader queried before the commit and stores its result after the invalidation
+        cache.set(f'ratings:{song_id}:v0', (1, 0))
+
+        data = json.loads(client.get(f'/api/ratings/{song_id}').data)
+        assert data['thumbs_up'] == 2
+
+    def test_counts_version_never_reused(self, client):
+        """Test that counts cached under an expired version are not revived by the next write"""
+        song_id = 'test_song_version'
+        write_rating(song_id, 'Test Artist', 'Test Song', 'c' * 32, 1)
+        invalidate_ratings(song_id)
+        client.get(f'/api/ratings/{song_id}')
+
+        # The version key expires while the counts cached under it are still live
+        cache.delete(f'ratings:{song_id}:version')
+        write_rating(song_id, 'Test Artist', 'Test Song', 'd' * 32, 1)
+        invalidate_ratings(song_id)
+
+        data = json.loads(client.get(f'/api/ratings/{song_id}').data)
+        assert data['thumbs_up'] == 2
+
+    def test_legacy_fingerprint_rating_replaced(self, client):
+        """Test that a rating stored under the old SHA-256 fingerprint is taken over"""
+        # Databases created before the switch have no fingerprint length CHECK
+        conn = sqlite3.connect(':memory:')
+        conn.execute('CREATE TABLE songs (song_id TEXT PRIMARY KEY, artist TEXT NOT NULL, title TEXT NOT NULL)')
+        conn.execute('''
+            CREATE TABLE ratings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                song_id TEXT NOT NULL,
+                user_fingerprint TEXT NOT NULL,
+                rating INTEGER NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(song_id, user_fingerprint)
+            )
+        ''')
+        legacy_fp = 'a' * 64
+        new_fp = 'b' * 32
+        conn.execute("INSERT INTO ratings (song_id, user_fingerprint, rating) VALUES ('legacy_song', ?, 1)", (legacy_fp,))
+
+        _apply_rating(conn.cursor(), 'legacy_song', 'Test Artist', 'Test Song', new_fp, -1, legacy_fp)
+        rows = conn.execute('SELECT user_fingerprint, rating FROM ratings').fetchall()
+        assert rows == [(new_fp, -1)]
+
+        # Removing also clears a leftover legacy rating
+        conn.execute("INSERT INTO ratings (song_id, user_fingerprint, rating) VALUES ('legacy_song', ?, 1)", (legacy_fp,))
+        removed = _apply_rating(conn.cursor(), 'legacy_song', 'Test Artist', 'Test Song', new_fp, 0, legacy_fp)
+        assert removed == 2
+        assert conn.execute('SELECT COUNT(*) FROM ratings').fetchone()[0] == 0
+        conn.close()
+
+    @patch('app._has_legacy_fingerprints', True)
+    def test_legacy_fingerprint_rating_read(self, client):
+        """Test that a user still sees a rating stored under their old SHA-256 fingerprint"""
+        headers = {'User-Agent': 'legacy-test'}
+        with app.test_request_context(headers=headers, environ_base={'REMOTE_ADDR': '127.0.0.1'}):
+            legacy_fp = get_legacy_fingerprint()
+
+        # Databases created before the switch have no fingerprint length CHECK
+        conn = sqlite3.connect(':memory:')
+        conn.execute('CREATE TABLE songs (song_id TEXT PRIMARY KEY, artist TEXT NOT NULL, title TEXT NOT NULL)')
+        conn.execute('CREATE TABLE ratings (song_id TEXT NOT NULL, user_fingerprint TEXT NOT NULL, rating INTEGER NOT NULL)')
+        conn.execute("INSERT INTO songs VALUES ('legacy_song', 'Test Artist', 'Test Song')")
+        conn.execute("INSERT INTO ratings VALUES ('legacy_song', ?, 1), ('legacy_song', ?, 1)",
+                     (legacy_fp, 'c' * 64))
+
+        with patch('app.get_db_connection', return_value=conn):
+            for _ in range(2):  # a database read, then cached counts
+                data = json.loads(client.get('/api/ratings/legacy_song', headers=headers).data)
+                assert data['thumbs_up'] == 2
+                assert data['user_rating'] == 1
+        conn.close()
+
+    def test_legacy_fingerprint_only_when_needed(self, client):
+        """Test that the SHA-256 fingerprint is only computed while legacy ratings exist"""
+        with app.test_request_context():
+            assert get_legacy_fingerprint() is None
+
+        db_fd, db_path = tempfile.mkstemp()
+        conn = sqlite3.connect(db_path)
+        conn.execute('CREATE TABLE ratings (song_id TEXT NOT NULL, user_fingerprint TEXT NOT NULL, rating INTEGER NOT NULL)')
+        conn.execute("INSERT INTO ratings VALUES ('legacy_song', ?, 1)", ('a' * 64,))
+        conn.commit()
+        conn.close()
+        try:
+            with patch('app.DB_PATH', db_path), patch('app._has_legacy_fingerprints', False):
+                init_db()
+                with app.test_request_context(), patch('app.hashlib.sha256', wraps=app_module.hashlib.sha256) as sha256:
+                    fingerprint = get_legacy_fingerprint()
+                    assert len(fingerprint) == 64
+                    # Memoized for the rest of the request
+                    assert get_legacy_fingerprint() == fingerprint
+                    assert sha256.call_count == 1
+        finally:
+            os.close(db_fd)
+            os.unlink(db_path)
+
     def test_invalid_rating_value(self, client):
         """Test submitting invalid rating value"""
         rating_data = {
@@ -216,11 +503,112 @@ class TestCacheHeaders:
 
     def test_api_no_cache_headers(self, client):
         """Test that API endpoints have no-cache headers"""
-        response = client.get('/api/ratings/test')
+        response = client.post('/api/rate',
+                               data=json.dumps({'song_id': 'test'}),
+                               content_type='application/json')
         assert 'Cache-Control' in response.headers
         assert 'no-cache' in response.headers.get('Cache-Control', '')
         assert 'no-store' in response.headers.get('Cache-Control', '')
 
+    def test_ratings_revalidate_headers(self, client):
+        """Test that ratings must be revalidated and only cached privately"""
+        response = client.get('/api/ratings/test')
+        cache_control = response.headers.get('Cache-Control', '')
+        assert 'no-cache' in cache_control
+        assert 'private' in cache_control
+        assert response.headers.get('ETag')
+
+    def test_ratings_not_modified(self, client):
+        """Test that an unchanged rating state answers 304"""
+        song_id = 'test_song_etag'
+        rating_data = {
+            'song_id': song_id,
+            'artist': 'Test Artist',
+            'title': 'Test Song',
+            'rating': 0
+        }
+        client.post('/api/rate',
+                    data=json.dumps(rating_data),
+                    content_type='application/json')
+        response = client.get(f'/api/ratings/{song_id}')
+        etag = response.headers['ETag']
+
+        response = client.get(f'/api/ratings/{song_id}', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.data == b''
+
+        # A new rating changes the ETag
+        rating_data['rating'] = 1
+        client.post('/api/rate',
+                    data=json.dumps(rating_data),
+                    content_type='application/json')
+        response = client.get(f'/api/ratings/{song_id}', headers={'If-None-Match': etag})
+        assert response.status_code == 200
+
+    def test_static_long_cache(self, client):
+        """Test that versioned static assets are cached for a year without revalidation"""
+        response = client.get('/static/style.css?v=1')
+        cache_control = response.headers.get('Cache-Control', '')
+        assert 'max-age=31536000' in cache_control
+        assert 'public' in cache_control
+        assert 'no-cache' not in cache_control
+        assert 'immutable' in cache_control
+
+    def test_unversioned_static_revalidated(self, client):
+        """Test that static URLs without ?v= are not pinned, e.g. the lazily loaded hls.js"""
+        response = client.get('/static/style.css')
+        assert response.status_code == 200
+        cache_control = response.headers.get('Cache-Control', '')
+        assert 'max-age=31536000' not in cache_control
+        assert 'immutable' not in cache_control
+
+    def test_static_revalidation_keeps_long_cache(self, client):
+        """Test that a 304 for a static asset carries the long cache headers too"""
+        response = client.get('/static/style.css?v=1')
+        for headers in ({'If-None-Match': response.headers['ETag']},
+                        {'If-Modified-Since': response.headers['Last-Modified']}):
+            revalidated = client.get('/static/style.css?v=1', headers=headers)
+            assert revalidated.status_code == 304
+            cache_control = revalidated.headers.get('Cache-Control', '')
+            assert 'max-age=31536000' in cache_control
+            assert 'immutable' in cache_control
+            assert 'no-cache' not in cache_control
+
+    def test_static_precompressed_brotli(self, client):
+        """Test that a sibling .br file is served to clients that accept brotli"""
+        br_path = os.path.join(app.static_folder, 'style.css.br')
+        with open(br_path, 'wb') as f:
+            f.write(b'compressed-css')
+        try:
+            response = client.get('/static/style.css?v=1', headers={'Accept-Encoding': 'gzip, br'})
+            assert response.status_code == 200
+            assert response.data == b'compressed-css'
+            assert response.headers['Content-Encoding'] == 'br'
+            assert response.mimetype == 'text/css'
+            assert 'Accept-Encoding' in response.headers.get('Vary', '')
+            assert 'immutable' in response.headers.get('Cache-Control', '')
+
+            revalidated = client.get('/static/style.css?v=1', headers={
+                'Accept-Encoding': 'br', 'If-None-Match': response.headers['ETag']
+            })
+            assert revalidated.status_code == 304
+            assert 'no-cache' not in revalidated.headers.get('Cache-Control', '')
+
+            for accept_encoding in ('gzip', 'gzip, br;q=0'):
+                response = client.get('/static/style.css?v=1', headers={'Accept-Encoding': accept_encoding})
+                assert response.status_code == 200
+                assert response.data != b'compressed-css'
+                assert 'Content-Encoding' not in response.headers
+                assert 'Accept-Encoding' in response.headers.get('Vary', '')
+        finally:
+            os.remove(br_path)
+
+    def test_static_missing_not_cached(self, client):
+        """Test that missing static assets do not get the long cache"""
+        response = client.get('/static/missing.css')
+        assert response.status_code == 404
+        assert 'max-age=31536000' not in response.headers.get('Cache-Control', '')
+
     def test_html_short_cache(self, client):
         """Test that HTML pages have short cache"""
         response = client.get('/')
@@ -241,7 +629,7 @@ class TestUserFingerprinting:
         ):
             fingerprint = get_user_fingerprint()
             assert isinstance(fingerprint, str)
-            assert len(fingerprint) == 64  # SHA-256 hash length
+            assert len(fingerprint) == 32  # 128-bit BLAKE2b hex length
 
     def test_different_ips_different_fingerprints(self, client):
         """Test that different IPs produce different fingerprints"""
@@ -261,6 +649,20 @@ class TestUserFingerprinting:
 
         assert fingerprint1 != fingerprint2
 
+    def test_fingerprint_memoized_per_request(self, client):
+        """Test that the fingerprint is computed once per request"""
+        with app.test_request_context(
+            '/',
+            environ_base={'REMOTE_ADDR': '127.0.0.1'},
+            headers={'User-Agent': 'TestBrowser/1.0'}
+        ):
+            fingerprint = get_user_fingerprint()
+            assert g.user_fp == fingerprint
+
+            # A memoized value is returned without recomputing
+            g.user_fp = 'memoized'
+            assert get_user_fingerprint() == 'memoized'
+
     def test_x_forwarded_for_header(self, client):
         """Test that X-Forwarded-For header is used for fingerprinting"""
         with app.test_request_context(
@@ -297,6 +699,126 @@ class TestDatabase:
         response = client.get('/api/ratings/db_test')
         assert response.status_code == 200
 
+    def test_song_columns_migrated(self, client):
+        """Test that artist/title move from ratings rows into the songs table"""
+        db_fd, db_path = tempfile.mkstemp()
+        conn = sqlite3.connect(db_path)
+        conn.execute('''
+            CREATE TABLE ratings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                song_id TEXT NOT NULL,
+                artist TEXT NOT NULL,
+                title TEXT NOT NULL,
+                user_fingerprint TEXT NOT NULL,
+                rating INTEGER NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(song_id, user_fingerprint)
+            )
+        ''')
+        conn.execute("INSERT INTO ratings (song_id, artist, title, user_fingerprint, rating) "
+                     "VALUES ('old_song', 'Old Artist', 'Old Song', 'fp1', 1), "
+                     "('old_song', 'Old Artist', 'Old Song', 'fp2', -1)")
+        conn.commit()
+        conn.close()
+
+        try:
+            with patch('app.DB_PATH', db_path):
+                init_db()
+            conn = sqlite3.connect(db_path)
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(ratings)')]
+            songs = conn.execute('SELECT song_id, artist, title FROM songs').fetchall()
+            rating_count = conn.execute('SELECT COUNT(*) FROM ratings').fetchone()[0]
+            conn.close()
+        finally:
+            os.close(db_fd)
+            os.unlink(db_path)
+
+        assert 'artist' not in columns and 'title' not in columns
+        assert songs == [('old_song', 'Old Artist', 'Old Song')]
+        assert rating_count == 2
+
+    def test_connection_reused_within_thread(self, client):
+        """Test that the same thread gets the same warm connection"""
+        with app.app_context():
+            conn1 = get_db_connection()
+        with app.app_context():
+            conn2 = get_db_connection()
+        assert conn1 is conn2
+
+    def test_broken_pg_connection_returned_to_pool(self, client):
+        """Test that a PostgreSQL connection whose commit fails is closed and returned to the pool"""
+        pool = MagicMock()
+        conn = MagicMock(prepared=True, closed=0)
+        conn.commit.side_effect = Exception('connection already closed')
+        pool.getconn.return_value = conn
+
+        with patch('app.USE_POSTGRES', True), patch('app._pg_pool', pool):
+            with app.app_context():
+                assert get_db_connection() is conn
+            pool.putconn.assert_called_once_with(conn, close=True)
+
+            # A healthy connection goes back open, ready for reuse
+            pool.reset_mock()
+            conn.commit.side_effect = None
+            with app.app_context():
+                get_db_connection()
+            pool.putconn.assert_called_once_with(conn, close=False)
+
+    def test_statement_rendering(self, client):
+        """Test that statements use ? on SQLite and PREPARE/EXECUTE on PostgreSQL"""
+        template = 'SELECT rating FROM ratings WHERE song_id = {} AND user_fingerprint = {}'
+        assert _statement('get_rating', template, 2) == \
+            'SELECT rating FROM ratings WHERE song_id = ? AND user_fingerprint = ?'
+
+        prepared = []
+        with patch('app.USE_POSTGRES', True), patch('app.PG_PREPARED_STATEMENTS', prepared):
+            assert _statement('get_rating', template, 2) == 'EXECUTE get_rating(%s, %s)'
+        assert prepared == [
+            'PREPARE get_rating AS SELECT rating FROM ratings WHERE song_id = $1 AND user_fingerprint = $2'
+        ]
+
+    def test_pg_connections_prepared_once(self, client):
+        """Test that pooled and writer connections prepare their statements exactly once"""
+        statements = ['PREPARE a AS SELECT 1', 'PREPARE b AS SELECT 2']
+
+        def prepare_calls(conn):
+            return [args[0] for args, _ in conn.cursor.return_value.execute.call_args_list
+                    if args[0].startswith('PREPARE')]
+
+        pooled, replacement, writer = (MagicMock(prepared=False, closed=0) for _ in range(3))
+        pool = MagicMock()
+        # The pool hands the same connection out twice, then a new one after a reconnect
+        pool.getconn.side_effect = [pooled, pooled, replacement]
+
+        with patch('app.USE_POSTGRES', True), patch('app.PG_PREPARED_STATEMENTS', statements), \
+                patch('app._pg_pool', pool), patch('app._connect', return_value=writer):
+            for _ in range(3):
+                with app.app_context():
+                    get_db_connection()
+            write_rating('prepared_song', 'Test Artist', 'Test Song', 'c' * 32, 1)
+            write_rating('prepared_song', 'Test Artist', 'Test Song', 'd' * 32, 1)
+
+        assert prepare_calls(pooled) == statements
+        assert prepare_calls(replacement) == statements
+        assert prepare_calls(writer) == statements
+        assert pooled.prepared and replacement.prepared and writer.prepared
+
+    def test_concurrent_writes_committed(self, client):
+        """Test that writes queued from many threads all reach the database"""
+        song_id = 'concurrent_test'
+        threads = [
+            threading.Thread(target=write_rating, args=(song_id, 'Test Artist', 'Test Song', f'{i:032x}', 1))
+            for i in range(20)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        response = client.get(f'/api/ratings/{song_id}')
+        data = json.loads(response.data)
+        assert data['thumbs_up'] == 20
+
     def test_unique_constraint(self, client):
         """Test that one user can only rate a song once"""
         song_id = 'unique_test'